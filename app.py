@@ -1,69 +1,111 @@
 import streamlit as st
+from streamlit.errors import StreamlitSecretNotFoundError
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload, build_http
 from google.oauth2 import service_account
+import google_auth_httplib2
 from PIL import Image
-import io, os, re
+import hashlib, io, re, string, threading, time, unicodedata
+from concurrent.futures import ThreadPoolExecutor
 import pymysql
+import pymysqlpool
 import pandas as pd
 
 # --- Authentication ---
-# Try to use Streamlit secrets (for deployment), fall back to local file (for testing)
-try:
-    # Streamlit Cloud deployment
-    creds_dict = st.secrets["google_service_account"]
-    creds = service_account.Credentials.from_service_account_info(
-        creds_dict,
-        scopes=["https://www.googleapis.com/auth/drive"]
-    )
-    FOLDER_ID = st.secrets["drive"]["folder_id"]
+# Errors raised when a secret (or the whole secrets file) is missing
+SECRETS_ERRORS = (KeyError, FileNotFoundError, StreamlitSecretNotFoundError)
+
+@st.cache_resource  # Load once per process, not on every rerun
+def load_credentials():
+    """
+    Load the Drive credentials, Drive folder ID and database config.
+    Try to use Streamlit secrets (for deployment), fall back to local file (for testing).
+    """
+    try:
+        # Streamlit Cloud deployment
+        creds_dict = st.secrets["google_service_account"]
+        folder_id = st.secrets["drive"]["folder_id"]
+        creds = service_account.Credentials.from_service_account_info(
+            creds_dict,
+            scopes=["https://www.googleapis.com/auth/drive"]
+        )
+    except SECRETS_ERRORS:
+        # Local testing with credentials.json
+        print("\n⚠️ Using local credentials.json file.")
+        SERVICE_ACCOUNT_FILE = "credentials.json"
+        folder_id = "0AGhLT2zlih_HUk9PVA"
+        
+        creds = service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE,
+            scopes=["https://www.googleapis.com/auth/drive"]
+        )
     
-    # Try to get database credentials from secrets
+    # Database credentials come from secrets both on Streamlit Cloud and locally
+    # (.streamlit/secrets.toml), which is safer than hardcoding them
     try:
-        DB_CONFIG = {
-            "host": st.secrets["database"]["host"],
-            "port": int(st.secrets["database"]["port"]),
-            "user": st.secrets["database"]["user"],
-            "password": st.secrets["database"]["password"],
-            "database": st.secrets["database"]["database"]
+        db_secrets = st.secrets["database"]
+        db_config = {
+            "host": db_secrets["host"],
+            "port": int(db_secrets["port"]),
+            "user": db_secrets["user"],
+            "password": db_secrets["password"],
+            "database": db_secrets["database"]
         }
         print("\n✅ Database credentials loaded from secrets.")
-    except Exception as e:
+    except SECRETS_ERRORS + (ValueError,) as e:
+        db_config = {}
         print(f"\n⚠️ Could not load database credentials: {str(e)}")
         print("Database search functionality will be limited.")
-
-except:
-    # Local testing with credentials.json
-    print("\n⚠️ Using local credentials.json file.")
-    SERVICE_ACCOUNT_FILE = "credentials.json"
-    FOLDER_ID = "0AGhLT2zlih_HUk9PVA"
+        print("To use real credentials locally, create a .streamlit/secrets.toml file.")
+        print("See SECRETS_TEMPLATE.md for instructions.\n")
     
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/drive"]
+    return creds, folder_id, db_config
+
+creds, FOLDER_ID, DB_CONFIG = load_credentials()
+
+@st.cache_resource  # Build the client once per process, not on every rerun
+def get_drive_service():
+    """Create and return the Google Drive API client."""
+    # Use the discovery document bundled with the client instead of fetching it
+    return build(
+        "drive",
+        "v3",
+        credentials=creds,
+        cache_discovery=False,
+        static_discovery=True
     )
-    
-    # For local testing, use a local secrets.toml file or environment variables
-    # This is safer than hardcoding credentials
-    DB_CONFIG = {
-        "host": st.secrets["database"]["host"],
-        "port": st.secrets["database"]["port"],
-        "user": st.secrets["database"]["user"],
-        "password": st.secrets["database"]["password"],
-        "database": st.secrets["database"]["database"]
-    }
-    
-    # Print instructions for local setup
-    print("\n⚠️ Using placeholder database credentials.")
-    print("To use real credentials locally, create a .streamlit/secrets.toml file.")
-    print("See SECRETS_TEMPLATE.md for instructions.\n")
 
-service = build("drive", "v3", credentials=creds)
+service = get_drive_service()
+
+# Per-thread storage for Drive HTTP connections. A plain threading.local, so
+# upload worker threads can use it without calling into Streamlit
+_drive_http_local = threading.local()
+
+def drive_http():
+    """
+    Return an authorized HTTP connection for the current thread.
+    httplib2 isn't thread-safe and the cached service is shared by every
+    session, so requests on it must be executed with this. Streamlit runs
+    each script run on a new thread, so a connection lasts for one script
+    run (or one upload worker thread), not across reruns.
+    """
+    if not hasattr(_drive_http_local, "http"):
+        _drive_http_local.http = google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+    return _drive_http_local.http
 
 # --- Utility functions ---
+_FILENAME_CHARS = set(string.ascii_letters + string.digits + "_-")
+_FILENAME_TRANS = str.maketrans("", "", "".join(chr(c) for c in range(256) if chr(c) not in _FILENAME_CHARS))
+_SANITIZE_RE = re.compile(r"[^A-Za-z0-9_-]")
+_HAS_DIGIT_RE = re.compile(r"\d")
+_WORD_RE = re.compile(r"\w+")
+
 def sanitize_filename(name: str) -> str:
     """Remove spaces & special chars."""
-    return re.sub(r"[^A-Za-z0-9_-]", "", name.replace(" ", "_"))
+    name = name.replace(" ", "_")
+    if name.isascii():
+        return name.translate(_FILENAME_TRANS)
+    return _SANITIZE_RE.sub("", name)
 
 def encrypt_pp_number(original_pp: str) -> str:
     """
@@ -103,80 +145,146 @@ def decrypt_pp_number(encrypted_pp: str) -> str:
     
     return original_pp
 
-def compress_image(file) -> str:
-    """Compress image under 50 KB and return temp path."""
-    image = Image.open(file).convert("RGB")
-    temp_path = "temp.jpg"
+# Bilinear is much cheaper than Lanczos and the difference is lost in a sub-50 KB JPEG
+RESIZE_FILTER = Image.BILINEAR
+
+def _encode_jpeg(image, buf: io.BytesIO, quality: int) -> int:
+    """Encode image into buf (overwriting it) and return the encoded size."""
+    buf.seek(0)
+    buf.truncate()
+    image.save(buf, "JPEG", optimize=True, quality=quality)
+    return buf.tell()
+
+def compress_image(file) -> tuple:
+    """Compress image under 50 KB and return an in-memory JPEG buffer and its size."""
+    image = Image.open(file)
+    
+    # Let libjpeg decode JPEGs at a reduced scale; PNGs are decoded as-is
+    if image.format == "JPEG":
+        image.draft("RGB", (1024, 1024))
+    image = image.convert("RGB")
+    buf = io.BytesIO()
     
     # Get original dimensions
     width, height = image.size
-    
-    # Start with original size and quality
-    new_width, new_height = width, height
-    quality = 85
     scale_factor = 1.0
+    candidate = image
     
-    # First try just compressing without resizing
-    image.save(temp_path, "JPEG", optimize=True, quality=quality)
-    
-    # If still too large, start resizing and compressing
-    while os.path.getsize(temp_path) >= 50_000 and quality >= 10:
-        # Reduce quality first
-        quality -= 5
-        image.save(temp_path, "JPEG", optimize=True, quality=quality)
+    # Shrink to 80% at a time until the image fits at minimum quality
+    while _encode_jpeg(candidate, buf, 10) > 50_000:
+        scale_factor *= 0.8
+        new_width = int(width * scale_factor)
+        new_height = int(height * scale_factor)
+        if new_width < 1 or new_height < 1:
+            break
+        candidate = image.resize((new_width, new_height), RESIZE_FILTER)
+    else:
+        # Binary search for the highest quality that still fits under 50 KB
+        lo, hi = 10, 85
+        last_quality = 10
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            last_quality = mid
+            if _encode_jpeg(candidate, buf, mid) <= 50_000:
+                lo = mid
+            else:
+                hi = mid - 1
         
-        # If still too large after minimum quality, start reducing size
-        if os.path.getsize(temp_path) >= 50_000 and quality <= 10:
-            scale_factor *= 0.8  # Reduce to 80% each time
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-            resized_image = image.resize((new_width, new_height), Image.LANCZOS)
-            resized_image.save(temp_path, "JPEG", optimize=True, quality=quality)
-            
-            # Reset quality to try again with smaller image
-            quality = 30
+        # Make sure the buffer holds the encode at the chosen quality
+        if last_quality != lo:
+            _encode_jpeg(candidate, buf, lo)
     
-    return temp_path
+    size = buf.tell()
+    buf.seek(0)
+    return buf, size
+
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024  # Drive recommends resumable uploads above 5 MB
 
-def upload_to_drive(local_path, filename):
+def upload_to_drive(buf, filename):
     meta = {"name": filename, "parents": [FOLDER_ID]}
-    media = MediaFileUpload(local_path, mimetype="image/jpeg")
+    # Small files go up in a single multipart request instead of a resumable session
+    resumable = buf.getbuffer().nbytes > RESUMABLE_UPLOAD_THRESHOLD
+    media = MediaIoBaseUpload(buf, mimetype="image/jpeg", resumable=resumable)
     file = service.files().create(
         body=meta, 
         media_body=media, 
         fields="id",
         supportsAllDrives=True
-    ).execute()
+    ).execute(http=drive_http())
     return file.get("id")
 
+UPLOAD_WORKERS = 4
+DRIVE_WRITES_PER_SECOND = 10  # Drive's per-user write rate limit
+
+def upload_many_to_drive(items):
+    """
+    Upload (buffer, filename) pairs concurrently.
+    Returns a (file ID, error) pair per item, in order, so one failed upload
+    doesn't hide the IDs of those that succeeded.
+    """
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = []
+        for i, (buf, filename) in enumerate(items):
+            # Pace submissions so large batches stay under the rate limit
+            if i and len(items) > DRIVE_WRITES_PER_SECOND:
+                time.sleep(1 / DRIVE_WRITES_PER_SECOND)
+            # upload_to_drive uses drive_http(), so each worker thread has its own connection.
+            # Each upload also gets its own buffer, since uploads seek and read it
+            futures.append(executor.submit(upload_to_drive, io.BytesIO(buf.getvalue()), filename))
+        
+        results = []
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                print(f"Drive upload error: {type(e).__name__} - {str(e)}")
+                results.append((None, e))
+        return results
+
 def find_file_id(filename):
     results = service.files().list(
         q=f"name='{filename}' and '{FOLDER_ID}' in parents",
         fields="files(id)",
         supportsAllDrives=True,
         includeItemsFromAllDrives=True
-    ).execute()
+    ).execute(http=drive_http())
     files = results.get("files", [])
     return files[0]["id"] if files else None
 
+SMALL_FILE_LIMIT = 1024 * 1024  # Files up to 1 MB are downloaded in one request
+
+DRIVE_RESULT_LIMIT = 50  # Only the first page of matching files is fetched
+
 def search_files(search_term):
-    """Search for files in the shared drive folder that match the search term."""
+    """
+    Search for files in the shared drive folder that match the search term.
+    Returns the first page of files and whether more matching files exist.
+    """
     results = service.files().list(
         q=f"name contains '{search_term}' and '{FOLDER_ID}' in parents",
-        fields="files(id, name)",
+        fields="nextPageToken, files(id, name, size)",
+        pageSize=DRIVE_RESULT_LIMIT,
+        orderBy="name",
         supportsAllDrives=True,
         includeItemsFromAllDrives=True
-    ).execute()
+    ).execute(http=drive_http())
     files = results.get("files", [])
-    return files
+    # Drive can return short pages, so only nextPageToken reliably signals more results
+    return files, "nextPageToken" in results
 
-def download_file(file_id):
+def download_file(file_id, size=None):
+    """Download a Drive file into memory; small files are fetched in a single GET."""
     request = service.files().get_media(
         fileId=file_id,
         supportsAllDrives=True
     )
+    if size is not None and size <= SMALL_FILE_LIMIT:
+        return io.BytesIO(request.execute(http=drive_http()))
+    
+    # Larger or unknown size: download in 1 MB chunks
     fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+    request.http = drive_http()  # MediaIoBaseDownload uses the request's connection
+    downloader = MediaIoBaseDownload(fh, request, chunksize=SMALL_FILE_LIMIT)
     done = False
     while not done:
         _, done = downloader.next_chunk()
@@ -184,25 +292,30 @@ def download_file(file_id):
     return fh
 
 # --- Database functions ---
-@st.cache_resource(ttl=300)  # Cache for 5 minutes only
-def get_db_connection():
-    """Create and return a database connection."""
+@st.cache_resource  # One pool per process, shared across sessions
+def get_db_pool():
+    """Create and return a database connection pool."""
     try:
         # Print connection details for debugging (without password)
         debug_config = DB_CONFIG.copy()
         debug_config["password"] = "*****"
-        print(f"Attempting to connect to database with: {debug_config}")
+        print(f"Attempting to create database pool with: {debug_config}")
         
         # Set a shorter timeout for connection attempts (5 seconds for cloud)
-        conn = pymysql.connect(**DB_CONFIG, connect_timeout=5)
+        pool = pymysqlpool.ConnectionPool(
+            size=5,
+            maxsize=20,
+            pre_create_num=2,
+            name="devotee",
+            connect_timeout=5,
+            # Searches are read-only; autocommit stops pooled connections from
+            # keeping one REPEATABLE READ snapshot for their whole lifetime
+            autocommit=True,
+            **DB_CONFIG
+        )
+        print("Database pool created.")
         
-        # Test the connection with a simple query
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            result = cursor.fetchone()
-            print(f"Database connection test result: {result}")
-        
-        return conn
+        return pool
     except pymysql.err.OperationalError as e:
         error_code = e.args[0] if e.args else 0
         if error_code == 2003:
@@ -213,129 +326,230 @@ def get_db_connection():
         print(f"Database connection error: {type(e).__name__}: {str(e)}")
         raise
 
-def search_devotees(search_term):
-    """Search devotees by First Name, Last Name, or PP Number."""
+def _trigrams(text: str) -> set:
+    """Return the set of lowercase 3-character substrings of text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+@st.cache_resource(ttl=3600)  # Refresh hourly to pick up new devotees
+def load_name_trigrams():
+    """
+    Load every 3-character substring that occurs in a first or last name.
+    Returns None if some name can't be reduced to plain ASCII, since the
+    collation may match it in ways the trigrams can't predict.
+    """
+    conn = get_db_pool().get_connection(pre_ping=True)
     try:
-        # Check if we're using placeholder credentials
-        if DB_CONFIG.get("user") == "user" and DB_CONFIG.get("password") == "password":
-            st.error("⚠️ Database credentials not configured.")
-            st.info("To use the database search feature:")
-            st.info("1. Create a .streamlit/secrets.toml file with your database credentials")
-            st.info("2. Or deploy to Streamlit Cloud and add credentials in the dashboard")
-            st.info("See SECRETS_TEMPLATE.md for instructions")
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT First_Name FROM devotee
+                UNION
+                SELECT DISTINCT Last_Name FROM devotee
+            """)
+            names = [row[0] for row in cursor.fetchall() if row[0]]
+    finally:
+        conn.close()
+    
+    trigrams = set()
+    for name in names:
+        trigrams |= _trigrams(name)
+        # The database collation ignores accents, so index the unaccented form too
+        unaccented = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+        if len(unaccented) != len(unicodedata.normalize("NFC", name)):
+            # Letters like 'ø' or 'ß' have no ASCII decomposition and were dropped
+            # ('Bjørn' -> 'Bjrn'), but LIKE '%bjorn%' may still match them
+            print(f"Name '{name}' has no plain ASCII form, disabling the name pre-filter")
             return None
+        trigrams |= _trigrams(unaccented)
+    print(f"Loaded {len(trigrams)} name trigrams from {len(names)} names")
+    return trigrams
+
+def could_match_name(search_term: str) -> bool:
+    """
+    Check whether any first or last name could contain each word of search_term.
+    A name can only contain a word if it contains every 3-character piece of it.
+    Words are checked separately because a full-text search can match the
+    first word in First_Name and the second in Last_Name.
+    """
+    # Non-ASCII terms and LIKE wildcards can't be checked this way
+    if not search_term.isascii() or "%" in search_term or "_" in search_term:
+        return True
+    name_trigrams = load_name_trigrams()
+    if name_trigrams is None:
+        return True
+    return all(_trigrams(word) <= name_trigrams for word in _WORD_RE.findall(search_term))
+
+@st.cache_resource  # Shared per process so a missing index is only hit once
+def fulltext_index_status():
+    """Return a mutable flag recording whether the ft_names FULLTEXT index exists."""
+    return {"available": True}
+
+def fulltext_boolean_term(search_term: str):
+    """
+    Build a boolean-mode AGAINST term requiring every word as a name prefix.
+    Returns None if any word is shorter than the FULLTEXT minimum token size.
+    """
+    words = _WORD_RE.findall(search_term)
+    if not words or any(len(word) < 3 for word in words):
+        return None
+    return " ".join(f"+{word}*" for word in words)
+
+DB_NOT_CONFIGURED = "⚠️ Database credentials not configured."
+DB_UNREACHABLE = "🔌 Cannot connect to database server"
+MIN_SEARCH_LENGTH = 3  # Shorter terms match too much of the table
+DB_RESULT_LIMIT = 200  # Maximum number of devotees returned per search
+
+def show_db_error(error):
+    """Display an error returned by search_devotees with troubleshooting hints."""
+    st.error(error)
+    if error == DB_NOT_CONFIGURED:
+        st.info("To use the database search feature:")
+        st.info("1. Create a .streamlit/secrets.toml file with your database credentials")
+        st.info("2. Or deploy to Streamlit Cloud and add credentials in the dashboard")
+        st.info("See SECRETS_TEMPLATE.md for instructions")
+    elif error == DB_UNREACHABLE:
+        st.warning("The database server is not accessible from this location.")
+        st.info("**Note:** The database at 10.3.8.200 is on a private network and cannot be reached from Streamlit Cloud.")
+        st.info("**Solutions:**")
+        st.info("• Use a cloud-hosted MySQL service (AWS RDS, Google Cloud SQL, etc.)")
+        st.info("• Set up a publicly accessible database server")
+        st.info("• The database search feature works when running locally")
+    elif error.startswith("Database connection error"):
+        st.info("The database server may be down or unreachable. Please try again later.")
+    else:
+        st.info("If you're seeing connection errors, check your database credentials.")
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def _query_devotees(search_term):
+    """
+    Query devotees matching search_term and return them as a DataFrame.
+    Errors are raised rather than returned so that failures are not cached.
+    """
+    # Check if this might be a PP number search
+    is_pp_search = search_term.isdigit() or (len(search_term) >= 2 and _HAS_DIGIT_RE.search(search_term) is not None)
+    
+    # Skip the query when no name can possibly match
+    if not is_pp_search and not could_match_name(search_term):
+        print(f"No name contains '{search_term}', skipping query")
+        return pd.DataFrame(columns=["Database ID", "First Name", "Last Name", "ID Number"])
+    
+    # Borrow a connection from the pool
+    conn = get_db_pool().get_connection(pre_ping=True)
+    
+    try:
+        # Create a cursor and execute the query
+        cursor = conn.cursor()
+        results = ()
         
-        try:    
-            # Try to get a connection
-            conn = get_db_connection()
+        # Word-prefix name matches can use the FULLTEXT index
+        fulltext_status = fulltext_index_status()
+        fulltext_term = None if is_pp_search else fulltext_boolean_term(search_term)
+        if fulltext_term and fulltext_status["available"]:
+            print(f"Full-text search term: '{fulltext_term}'")
+            try:
+                cursor.execute(f"""
+                    SELECT ID, First_Name, Last_Name, PP_Number 
+                    FROM devotee 
+                    WHERE MATCH(First_Name, Last_Name) AGAINST (%s IN BOOLEAN MODE)
+                    ORDER BY Last_Name, First_Name
+                    LIMIT {DB_RESULT_LIMIT}
+                """, (fulltext_term,))
+                results = cursor.fetchall()
+                print(f"Full-text query returned {len(results) if results else 0} results")
+            except pymysql.err.OperationalError as e:
+                # 1191: the ft_names FULLTEXT index hasn't been created
+                if e.args[0] != 1191:
+                    raise
+                fulltext_status["available"] = False
+                print("FULLTEXT index on names not found, using LIKE search from now on")
+        
+        # Unless the full-text query already filled the result limit, also
+        # match substrings so names containing the term mid-word (e.g. 'ram'
+        # in 'Sitaram') are found; this also covers PP numbers and short words
+        if len(results) < DB_RESULT_LIMIT:
+            # We can't decrypt in SQL, so match names as-is and, if this
+            # might be a PP number search, the encrypted PP number too
+            where = "First_Name LIKE %s OR Last_Name LIKE %s"
+            search_pattern = f"%{search_term}%"
+            params = [search_pattern, search_pattern]
+            print(f"Search pattern: '{search_pattern}'")
             
-            # Create a cursor and execute the query
-            cursor = conn.cursor()
+            if is_pp_search:
+                # Encrypt the search term to search the database
+                encrypted_search_term = encrypt_pp_number(search_term)
+                print(f"Encrypted search term: {encrypted_search_term}")
+                where += " OR PP_Number LIKE %s"
+                params.append(f"%{encrypted_search_term}%")
             
-            # We need to modify our approach since we can't decrypt in SQL
-            # First, get all potential matches by first name or last name
-            query = """
+            query = f"""
                 SELECT ID, First_Name, Last_Name, PP_Number 
                 FROM devotee 
-                WHERE First_Name LIKE %s 
-                   OR Last_Name LIKE %s 
+                WHERE {where}
                 ORDER BY Last_Name, First_Name
+                LIMIT {DB_RESULT_LIMIT}
             """
             
             # Log the query (without values for security)
             print(f"Executing query: {query.strip()}")
             
-            search_pattern = f"%{search_term}%"
-            print(f"Search pattern: '{search_pattern}'")
-            
-            # Execute the query with only first and last name parameters
-            cursor.execute(query, (search_pattern, search_pattern))
+            cursor.execute(query, params)
+            like_results = cursor.fetchall()
+            print(f"Query returned {len(like_results) if like_results else 0} results")
             
-            # Fetch all results and convert to list
-            initial_results = list(cursor.fetchall())
-            print(f"Initial query returned {len(initial_results) if initial_results else 0} results")
-            
-            # Close cursor
-            cursor.close()
-            
-            # Check if this might be a PP number search
-            if search_term.isdigit() or (len(search_term) >= 2 and any(c.isdigit() for c in search_term)):
-                # Encrypt the search term to search the database
-                encrypted_search_term = encrypt_pp_number(search_term)
-                print(f"Encrypted search term: {encrypted_search_term}")
-                
-                # Search for the encrypted PP number in the database
-                pp_query = """
-                    SELECT ID, First_Name, Last_Name, PP_Number 
-                    FROM devotee 
-                    WHERE PP_Number LIKE %s
-                    ORDER BY Last_Name, First_Name
-                """
-                
-                cursor = conn.cursor()
-                encrypted_pattern = f"%{encrypted_search_term}%"
-                cursor.execute(pp_query, (encrypted_pattern,))
-                pp_results = cursor.fetchall()
-                cursor.close()
-                
-                print(f"PP number search returned {len(pp_results) if pp_results else 0} results")
-                
-                # Combine with name search results, avoiding duplicates
-                seen_ids = set(r[0] for r in initial_results)
-                for result in pp_results:
-                    if result[0] not in seen_ids:
-                        initial_results.append(result)
-                        seen_ids.add(result[0])
-                
-                results = initial_results
-                print(f"Total results after combining: {len(results)} results")
-            else:
-                # Not a PP number search, use initial results
-                results = initial_results
-            
-        except pymysql.err.OperationalError as e:
-            # Handle specific database operational errors
-            error_code, error_message = e.args
-            if error_code == 2003:
-                st.error("🔌 Cannot connect to database server")
-                st.warning("The database server is not accessible from this location.")
-                st.info("**Note:** The database at 10.3.8.200 is on a private network and cannot be reached from Streamlit Cloud.")
-                st.info("**Solutions:**")
-                st.info("• Use a cloud-hosted MySQL service (AWS RDS, Google Cloud SQL, etc.)")
-                st.info("• Set up a publicly accessible database server")
-                st.info("• The database search feature works when running locally")
-            else:
-                st.error(f"Database connection error: {error_code} - {error_message}")
-                st.info("The database server may be down or unreachable. Please try again later.")
-            print(f"MySQL Operational Error: {error_code} - {error_message}")
-            return None
-            
-        except Exception as e:
-            # Handle other database errors
-            st.error(f"Database error: {type(e).__name__} - {str(e)}")
-            print(f"Unexpected database error: {type(e).__name__} - {str(e)}")
-            return None
+            # Merge with the full-text matches, keeping each devotee once
+            merged = {row[0]: row for row in results}
+            for row in like_results:
+                merged.setdefault(row[0], row)
+            results = sorted(merged.values(), key=lambda row: ((row[2] or "").lower(), (row[1] or "").lower()))
+            results = results[:DB_RESULT_LIMIT]
         
-        # Convert to DataFrame
-        if results:
-            df = pd.DataFrame(results, columns=["Database ID", "First Name", "Last Name", "PP Number"])
-            
-            # Convert PP_Number column to string to prevent scientific notation
-            df["PP Number"] = df["PP Number"].astype(str)
-            
-            # Decrypt the PP numbers
-            df["PP Number"] = df["PP Number"].apply(decrypt_pp_number)
-            
-            # Rename PP Number to ID Number
-            df = df.rename(columns={"PP Number": "ID Number"})
-            
-            return df
-        else:
-            return pd.DataFrame(columns=["Database ID", "First Name", "Last Name", "ID Number"])
+        # Close cursor
+        cursor.close()
+    finally:
+        # Return the connection to the pool
+        conn.close()
+    
+    # Convert to DataFrame
+    if results:
+        df = pd.DataFrame(results, columns=["Database ID", "First Name", "Last Name", "PP Number"])
+        
+        # Convert PP_Number column to string to prevent scientific notation
+        pp = df["PP Number"].astype(str)
+        
+        # Decrypt the PP numbers (same as decrypt_pp_number, but vectorized)
+        long_enough = pp.str.len() >= 4
+        pp[long_enough] = pp[long_enough].str[-2:] + pp[long_enough].str[2:-2] + pp[long_enough].str[:2]
+        df["PP Number"] = pp
+        
+        # Rename PP Number to ID Number
+        df = df.rename(columns={"PP Number": "ID Number"})
+        
+        return df
+    else:
+        return pd.DataFrame(columns=["Database ID", "First Name", "Last Name", "ID Number"])
+
+def search_devotees(search_term):
+    """
+    Search devotees by First Name, Last Name, or PP Number.
+    Returns a (DataFrame, error message) tuple; the DataFrame is None on error.
+    """
+    # Check if we're missing or using placeholder credentials
+    if not DB_CONFIG or (DB_CONFIG.get("user") == "user" and DB_CONFIG.get("password") == "password"):
+        return None, DB_NOT_CONFIGURED
+    
+    try:
+        return _query_devotees(search_term), None
+    except pymysql.err.OperationalError as e:
+        # Handle specific database operational errors
+        error_code, error_message = e.args
+        print(f"MySQL Operational Error: {error_code} - {error_message}")
+        if error_code == 2003:
+            return None, DB_UNREACHABLE
+        return None, f"Database connection error: {error_code} - {error_message}"
     except Exception as e:
-        st.error(f"Database error: {str(e)}")
-        st.info("If you're seeing connection errors, check your database credentials.")
-        return None
+        # Handle other database errors
+        print(f"Unexpected database error: {type(e).__name__} - {str(e)}")
+        return None, f"Database error: {type(e).__name__} - {str(e)}"
 
 # --- Streamlit UI ---
 st.title("📸 Nepali Form C Photo Uploader")
@@ -347,33 +561,50 @@ tab1, tab2 = st.tabs(["📤 Photo Management", "🔍 Database Search"])
 with tab1:
     st.subheader("Upload Photo")
     name = st.text_input("Person's Name")
-    photo = st.file_uploader("Choose a photo", type=["jpg", "jpeg", "png"])
+    photos = st.file_uploader("Choose photos", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
 
-    # Show image preview if photo is uploaded
-    if photo:
-        st.image(photo, caption="Preview", width="stretch")
+    # Show image preview if photos are uploaded
+    for photo in photos:
+        st.image(photo, caption=f"Preview: {photo.name}", width="stretch")
 
     # Add upload button
-    if st.button("Upload Photo") and photo and name:
+    if st.button("Upload Photo") and photos and name:
         safe_name = sanitize_filename(name)
-        compressed = compress_image(photo)
-        final_name = f"{safe_name}.jpg"
-
-        if os.path.getsize(compressed) <= 50_000:
-            fid = upload_to_drive(compressed, final_name)
+        
+        # Only recompress photos that weren't compressed on an earlier run
+        compressed_cache = st.session_state.get("compressed", {})
+        photo_keys = [hashlib.md5(photo.getvalue()).hexdigest() for photo in photos]
+        for photo, photo_key in zip(photos, photo_keys):
+            if photo_key not in compressed_cache:
+                compressed_cache[photo_key] = compress_image(photo)
+        st.session_state["compressed"] = {key: compressed_cache[key] for key in photo_keys}
+        
+        to_upload = []
+        for i, photo_key in enumerate(photo_keys, start=1):
+            compressed, compressed_size = compressed_cache[photo_key]
+            final_name = f"{safe_name}.jpg" if len(photos) == 1 else f"{safe_name}_{i}.jpg"
+            if compressed_size <= 50_000:
+                to_upload.append((compressed, final_name))
+            else:
+                st.error(f"❌ Could not compress {photos[i - 1].name} below 50 KB. Try a smaller photo.")
+        
+        upload_results = upload_many_to_drive(to_upload)
+        for (compressed, final_name), (fid, upload_error) in zip(to_upload, upload_results):
+            if upload_error:
+                st.error(f"❌ Could not upload {final_name}: {upload_error}")
+                continue
+            
             st.success(f"✅ Uploaded as {final_name}")
             st.caption(f"Drive file ID → {fid}")
             
             # Auto-download the compressed image
-            with open(compressed, "rb") as f:
-                st.download_button(
-                    label="⬇️ Download Compressed Image",
-                    data=f.read(),
-                    file_name=final_name,
-                    mime="image/jpeg"
-                )
-        else:
-            st.error("❌ Could not compress below 50 KB. Try a smaller photo.")
+            st.download_button(
+                label=f"⬇️ Download Compressed Image ({final_name})",
+                data=compressed.getvalue(),
+                file_name=final_name,
+                mime="image/jpeg",
+                key=f"download_{final_name}"
+            )
 
     st.divider()
     st.subheader("Download Photo")
@@ -381,20 +612,23 @@ with tab1:
 
     if search_term:
         # Search for matching files
-        matching_files = search_files(search_term)
+        matching_files, more_files = search_files(search_term)
         
         if matching_files:
             st.write(f"Found {len(matching_files)} file(s):")
+            if more_files:
+                st.caption(f"… showing the first {len(matching_files)} files, refine your search to see more.")
             
             # Create a dropdown with file names
             file_names = [f["name"] for f in matching_files]
             selected_file = st.selectbox("Select a file to download:", file_names)
             
-            # Find the selected file's ID
-            selected_file_id = next(f["id"] for f in matching_files if f["name"] == selected_file)
+            # Find the selected file's ID and size
+            selected = next(f for f in matching_files if f["name"] == selected_file)
+            selected_size = int(selected["size"]) if "size" in selected else None
             
             # Show preview of selected image
-            fh = download_file(selected_file_id)
+            fh = download_file(selected["id"], selected_size)
             st.image(fh, caption=f"Preview: {selected_file}", width="stretch")
             
             # Download button
@@ -413,15 +647,24 @@ with tab2:
     st.subheader("Search Devotees Database")
     st.write("Search by First Name, Last Name, or PP Number")
     
-    db_search_term = st.text_input("Enter search term:", key="db_search")
+    # Only search on submit, not on every keystroke
+    with st.form("devotee_search"):
+        db_search_term = st.text_input("Enter search term:", key="db_search").strip()
+        submitted = st.form_submit_button("Search")
     
-    if db_search_term:
+    if submitted and len(db_search_term) < MIN_SEARCH_LENGTH:
+        st.warning(f"Please enter at least {MIN_SEARCH_LENGTH} characters to search.")
+    elif submitted:
         with st.spinner("Searching database..."):
-            results_df = search_devotees(db_search_term)
+            results_df, db_error = search_devotees(db_search_term)
         
-        if results_df is not None:
+        if db_error:
+            show_db_error(db_error)
+        elif results_df is not None:
             if not results_df.empty:
                 st.success(f"Found {len(results_df)} result(s)")
+                if len(results_df) == DB_RESULT_LIMIT:
+                    st.warning(f"… more results truncated, showing the first {DB_RESULT_LIMIT}. Refine your search to narrow them down.")
                 
                 # Display results in a table
                 st.dataframe(
@@ -433,7 +676,7 @@ with tab2:
                 st.warning(f"No results found for '{db_search_term}'")
                 st.info("Try a different search term or check your spelling.")
                 st.info("You can search by First Name, Last Name, or PP Number.")
-                st.info("Partial matches are supported (e.g., 'Jo' will find 'John').")
+                st.info("Partial matches are supported (e.g., 'Joh' will find 'John').")
         
     else:
-        st.info("👆 Enter a search term above to search the database")
+        st.info("👆 Enter a search term above and press Search")